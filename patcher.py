@@ -1,15 +1,192 @@
 #!/usr/bin/env python3
 # patcher.py
 import argparse
+import collections
+import copy
+import functools
 import yaml
 import difflib
-import xml.etree.ElementTree as ET
+from lxml import etree as ET
 import pathlib
 import datetime
 import sys
-import tempfile
+import io
 from typing import Dict, Any
 
+# libyaml's C loader when PyYAML was built with it, else the pure-Python one
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
+# Keep whitespace and comments; never expand entities, so a template's
+# external entities cannot pull local files into the patched output
+_PARSER_OPTIONS = dict(remove_blank_text=False, remove_comments=False,
+                       resolve_entities=False)
+
+# Section elements patched by apply_patch and checked by validate_patch
+_TARGET_TAGS = ("BuildTradingOptions", "BuildMode", "SLPTOptions", "Conditions")
+
+# Config section -> the template element it patches
+_SECTION_TAGS = {
+    "trading_options": "BuildTradingOptions",
+    "build_mode": "BuildMode",
+    "slpt": "SLPTOptions",
+    "conditions": "Conditions",
+}
+
+# Condition sample type suffixes and their sampleType attribute values
+_SAMPLE_TYPES = {"IS": "10", "OOS": "20"}
+
+# Literal XPaths compiled once at import time and reused on every patch
+_XP = {
+    "condition":     ET.XPath("./Condition"),
+    "column_value":  ET.XPath("./Left-Side/Column-Value"),
+    "numeric_value": ET.XPath("./Right-Side/Numeric-Value"),
+}
+
+# Config value type -> XML text; SQX spells booleans in lowercase
+_TEXT_COERCE = {
+    bool: lambda v: "true" if v else "false",
+    int: int.__str__,
+    float: float.__repr__,
+    str: lambda v: v,
+}
+
+def _to_text(value, _coerce=_TEXT_COERCE):
+    """Convert a config value to the text written into the template"""
+    convert = _coerce.get(type(value))
+    return convert(value) if convert else str(value)
+
+def _first(xpath, node):
+    """Return the first node matched by a compiled XPath, or None"""
+    result = xpath(node)
+    return result[0] if result else None
+
+def _is_target(el):
+    """Return False for a Conditions element outside FilterParams"""
+    if el.tag != "Conditions":
+        return True
+    parent = el.getparent()
+    return parent is not None and parent.tag == "FilterParams"
+
+# Patchable sections of a template, any of which may be None
+_Targets = collections.namedtuple("_Targets", "params build_mode slpt conditions")
+
+def _needed_tags(cfg):
+    """Return the target tags for the config sections that have values"""
+    return tuple(tag for section, tag in _SECTION_TAGS.items() if cfg.get(section))
+
+def _locate_targets(tree: ET.ElementTree, need=_TARGET_TAGS) -> _Targets:
+    """
+    Locate every patchable section in a single walk of the tree
+    
+    Args:
+        tree: Template ElementTree
+        need: Target tags to look for; the walk stops once all are found
+              and is skipped entirely when none are needed
+        
+    Returns:
+        _Targets with the BuildTradingOptions Params node and the first
+        BuildMode, SLPTOptions and FilterParams Conditions elements;
+        sections not in need are None
+    """
+    found = {}
+    if need:
+        for el in tree.getroot().iter(*need):
+            tag = el.tag
+            if tag in found or not _is_target(el):
+                continue
+            found[tag] = el
+            if len(found) == len(need):
+                break
+    trading = found.get("BuildTradingOptions")
+    return _Targets(
+        trading.find("Params") if trading is not None else None,
+        found.get("BuildMode"),
+        found.get("SLPTOptions"),
+        found.get("Conditions"),
+    )
+
+def _load_yaml(path):
+    """
+    Parse a YAML config file
+    
+    Args:
+        path: Path to YAML file
+        
+    Returns:
+        Parsed configuration
+    """
+    # Binary mode lets libyaml decode the stream itself
+    with open(path, 'rb') as f:
+        return yaml.load(f, Loader=_YamlLoader)
+
+@functools.lru_cache(maxsize=128)
+def _load_yaml_cached(path_str, mtime_ns, size):
+    """
+    Parse a YAML config file, memoized on its path, mtime and size
+    
+    The mtime and size are only part of the cache key, so an edited file
+    misses the cache. Callers must deepcopy the result before mutating it.
+    """
+    return _load_yaml(path_str)
+
+def _load_config(path, use_cache=True):
+    """
+    Parse a YAML config file, reusing a cached parse when allowed
+    
+    Args:
+        path: Path to YAML file
+        use_cache: Reuse an earlier parse of the unchanged file
+        
+    Returns:
+        Parsed configuration, safe for the caller to mutate
+    """
+    path = pathlib.Path(path)
+    if not use_cache:
+        return _load_yaml(path)
+    st = path.stat()
+    return copy.deepcopy(_load_yaml_cached(str(path.resolve()), st.st_mtime_ns, st.st_size))
+
+def _is_utf8(data: bytes) -> bool:
+    """Return True if the bytes decode as UTF-8"""
+    # Checked directly because libxml2 versions report bad UTF-8 with
+    # different error codes
+    try:
+        data.decode('utf-8')
+    except UnicodeDecodeError:
+        return False
+    return True
+
+def _parse_xml_bytes(data: bytes) -> ET.ElementTree:
+    """
+    Parse XML bytes with preserved whitespace and comments
+    
+    Args:
+        data: Raw contents of an XML file
+        
+    Returns:
+        ET.ElementTree object
+    """
+    # Parse from bytes: lxml reports bad encodings in files as OSError,
+    # but as XMLSyntaxError for in-memory documents
+    parser = ET.XMLParser(**_PARSER_OPTIONS)
+    try:
+        tree = ET.fromstring(data, parser=parser).getroottree()
+    except ET.XMLSyntaxError as e:
+        # Reparse the same bytes as cp1252 (Windows default), but only
+        # when they are not valid UTF-8; report the original error if
+        # this is a real syntax error or cp1252 fails too
+        if _is_utf8(data):
+            raise
+        parser = ET.XMLParser(encoding='cp1252', **_PARSER_OPTIONS)
+        try:
+            tree = ET.fromstring(data, parser=parser).getroottree()
+        except ET.XMLSyntaxError:
+            raise e from None
+    return tree
+
 def load_xml(path: pathlib.Path) -> ET.ElementTree:
     """
     Load XML with preserved whitespace and comments
@@ -20,38 +197,167 @@ def load_xml(path: pathlib.Path) -> ET.ElementTree:
     Returns:
         ET.ElementTree object
     """
-    parser = ET.XMLParser(target=ET.TreeBuilder(insert_comments=True))
-    try:
-        tree = ET.parse(path, parser=parser)
-    except UnicodeDecodeError:
-        # Try with cp1252 encoding (Windows default)
-        with open(path, 'r', encoding='cp1252') as f:
-            content = f.read()
-        tree = ET.ElementTree(ET.fromstring(content, parser=parser))
-    return tree
+    return _parse_xml_bytes(pathlib.Path(path).read_bytes())
 
-def upsert_param(params_node, key, value, class_name="Generic"):
+def _index_params(params_node):
     """
-    Update or insert a parameter in a Params node
+    Index the Param children of a Params node by their key attribute
     
     Args:
         params_node: XML node containing parameters
-        key: Parameter key to update
-        value: New value for the parameter
-        class_name: Class attribute for the parameter
+        
+    Returns:
+        Dict mapping each key to its first Param element
     """
-    # Look for existing parameter with this key
-    param = params_node.find(f"./Param[@key='{key}']")
+    index = {}
+    for param in params_node.iterchildren("Param"):
+        index.setdefault(param.get("key"), param)
+    return index
+
+def _index_children(parent):
+    """
+    Index the child elements of a section node by tag
     
-    if param is not None:
-        # Update existing parameter
-        param.text = str(value)
-    else:
-        # Create new parameter
-        param = ET.SubElement(params_node, "Param")
-        param.set("key", key)
-        param.set("class", class_name)
-        param.text = str(value)
+    Args:
+        parent: Section node such as BuildMode or SLPTOptions
+        
+    Returns:
+        Dict mapping each tag to its first child element
+    """
+    index = {}
+    for child in parent.iterchildren(tag=ET.Element):
+        index.setdefault(child.tag, child)
+    return index
+
+def _find_child(parent, existing, key):
+    """
+    Look up the element a section config key refers to
+    
+    Args:
+        parent: Section node such as BuildMode or SLPTOptions
+        existing: Child index from _index_children(parent)
+        key: Child tag, or a slash-separated path to a nested element
+        
+    Returns:
+        The matching element, or None
+    """
+    if not isinstance(key, str):
+        return None
+    if '/' not in key:
+        return existing.get(key)
+    try:
+        return parent.find(key)
+    except SyntaxError:
+        # Not a usable path, so it cannot match anything
+        return None
+
+def _patch_trading_options(params, values):
+    """
+    Update or insert trading option Params from config values
+    
+    Args:
+        params: Params node under BuildTradingOptions
+        values: Mapping of parameter key to new value
+        
+    Returns:
+        List of (key, element, expected_text) for each value written
+    """
+    written = []
+    added = []
+    existing = _index_params(params)
+    for k, v in values.items():
+        if not isinstance(k, str):
+            raise ValueError(f"Cannot set trading option {k!r}: Param keys must be strings")
+        text = _to_text(v)
+        param = existing.get(k)
+        if param is None:
+            param = params.makeelement("Param", {"key": k, "class": "Generic"})
+            added.append(param)
+        param.text = text
+        written.append((k, param, text))
+    # Insert all new Params in one call
+    if added:
+        params.extend(added)
+    return written
+
+def _invalid_name(parent, key):
+    """Build the error for a config key that cannot become a child element"""
+    return ValueError(f"Cannot create <{key}> under <{parent.tag}>: not a valid element name")
+
+def _patch_children(parent, values):
+    """
+    Update or create child elements named after config keys
+    
+    Args:
+        parent: Section node such as BuildMode or SLPTOptions
+        values: Mapping of child tag (or slash-separated path) to new text
+        
+    Returns:
+        List of (key, element, expected_text) for each value written
+    """
+    written = []
+    added = []
+    existing = _index_children(parent)
+    for k, v in values.items():
+        # YAML allows non-string keys such as 2020, which can never be tags
+        if not isinstance(k, str):
+            raise _invalid_name(parent, k)
+        text = _to_text(v)
+        elem = _find_child(parent, existing, k)
+        if elem is None:
+            # Create the element if it doesn't exist
+            try:
+                elem = parent.makeelement(k, {})
+            except ValueError:
+                raise _invalid_name(parent, k) from None
+            added.append(elem)
+        elem.text = text
+        written.append((k, elem, text))
+    # Insert all new children in one call
+    if added:
+        parent.extend(added)
+    return written
+
+def _patch_conditions(conditions, values):
+    """
+    Update and enable filter conditions from config values
+    
+    Args:
+        conditions: Conditions node under FilterParams
+        values: Mapping of ColumnName_SampleType keys to threshold values
+    """
+    # Index conditions by (column, sampleType) so each config key
+    # is a single lookup instead of a scan of every Condition
+    index = {}
+    for condition in _XP["condition"](conditions):
+        col_value = _first(_XP["column_value"], condition)
+        if col_value is not None:
+            key = (col_value.get("column"), col_value.get("sampleType"))
+            index.setdefault(key, []).append(condition)
+    
+    for condition_key, v in values.items():
+        # Parse the condition key which should be in the format:
+        # ColumnName_SampleType where SampleType is either IS or OOS
+        if not isinstance(condition_key, str) or '_' not in condition_key:
+            continue
+        column_name, sample_type = condition_key.rsplit('_', 1)
+        if sample_type not in _SAMPLE_TYPES:
+            continue
+        sample_attr = _SAMPLE_TYPES[sample_type]
+        
+        # Update every condition on this column and sample type
+        for condition in index.get((column_name, sample_attr), ()):
+            numeric_val = _first(_XP["numeric_value"], condition)
+            if numeric_val is not None:
+                numeric_val.set("value", _to_text(v))
+                condition.set("use", "true")
+
+def _patch_trading_section(trading, values):
+    """Patch the Params node of a BuildTradingOptions element, if any"""
+    params = trading.find("Params")
+    if params is None:
+        return []
+    return _patch_trading_options(params, values)
 
 def apply_patch(tree: ET.ElementTree, cfg: dict):
     """
@@ -60,70 +366,199 @@ def apply_patch(tree: ET.ElementTree, cfg: dict):
     Args:
         tree: ElementTree to patch
         cfg: Configuration dictionary with patch values
+        
+    Returns:
+        List of (label, element, expected_text) checks for verify_checks,
+        one per trading option, build mode and SL/PT value written
     """
-    root = tree.getroot()
+    targets = _locate_targets(tree, _needed_tags(cfg))
+    checks = []
     
     # Patch trading options
-    if "trading_options" in cfg:
-        params = root.find(".//BuildTradingOptions/Params")
-        if params is not None:
-            for k, v in cfg["trading_options"].items():
-                upsert_param(params, k, v)
+    if cfg.get("trading_options") and targets.params is not None:
+        written = _patch_trading_options(targets.params, cfg["trading_options"])
+        checks.extend((f"trading_options.{k}", e, t) for k, e, t in written)
     
     # Patch build mode options
-    if "build_mode" in cfg:
-        build_mode = root.find(".//BuildMode")
-        if build_mode is not None:
-            for k, v in cfg["build_mode"].items():
-                elem = build_mode.find(f"./{k}")
-                if elem is not None:
-                    elem.text = str(v)
-                else:
-                    # Create the element if it doesn't exist
-                    new_elem = ET.SubElement(build_mode, k)
-                    new_elem.text = str(v)
+    if cfg.get("build_mode") and targets.build_mode is not None:
+        written = _patch_children(targets.build_mode, cfg["build_mode"])
+        checks.extend((f"build_mode.{k}", e, t) for k, e, t in written)
     
     # Patch SL/PT options
-    if "slpt" in cfg:
-        slpt = root.find(".//SLPTOptions")
-        if slpt is not None:
-            for k, v in cfg["slpt"].items():
-                elem = slpt.find(f"./{k}")
-                if elem is not None:
-                    elem.text = str(v)
-                else:
-                    # Create the element if it doesn't exist
-                    new_elem = ET.SubElement(slpt, k)
-                    new_elem.text = str(v)
+    if cfg.get("slpt") and targets.slpt is not None:
+        written = _patch_children(targets.slpt, cfg["slpt"])
+        checks.extend((f"slpt.{k}", e, t) for k, e, t in written)
     
     # Patch filter conditions
-    if "conditions" in cfg:
-        conditions = root.find(".//FilterParams/Conditions")
-        if conditions is not None:
-            for condition_key, v in cfg["conditions"].items():
-                # Parse the condition key which should be in the format:
-                # ColumnName_SampleType where SampleType is either IS or OOS
-                parts = condition_key.split('_')
-                if len(parts) < 2:
-                    continue
-                    
-                column_name = '_'.join(parts[:-1])
-                sample_type = parts[-1]  # IS or OOS
-                
-                # Find the right condition by column name and sample type
-                for condition in conditions.findall("./Condition"):
-                    col_value = condition.find("./Left-Side/Column-Value")
-                    if col_value is not None:
-                        if col_value.get("column") == column_name:
-                            # Check sample type (10=IS, 20=OOS)
-                            sample_attr = col_value.get("sampleType")
-                            if (sample_type == "IS" and sample_attr == "10") or \
-                               (sample_type == "OOS" and sample_attr == "20"):
-                                # Update the condition value
-                                numeric_val = condition.find("./Right-Side/Numeric-Value")
-                                if numeric_val is not None:
-                                    numeric_val.set("value", str(v))
-                                    condition.set("use", "true")
+    if cfg.get("conditions") and targets.conditions is not None:
+        _patch_conditions(targets.conditions, cfg["conditions"])
+    
+    return checks
+
+def verify_checks(checks):
+    """
+    Validate patched values from the checks returned by apply_patch
+    
+    Reads each element recorded while patching, so no lookups are made.
+    
+    Args:
+        checks: List of (label, element, expected_text) tuples
+        
+    Returns:
+        Tuple of (success, error_message)
+    """
+    for label, elem, expected in checks:
+        if elem.text != expected:
+            return False, f"Validation failed for {label}: expected '{expected}', got '{elem.text}'"
+    return True, "Validation successful"
+
+# Target tag -> (config section, patch function) used by _iterpatch
+_SECTION_PATCHERS = {
+    "BuildTradingOptions": ("trading_options", _patch_trading_section),
+    "BuildMode": ("build_mode", _patch_children),
+    "SLPTOptions": ("slpt", _patch_children),
+    "Conditions": ("conditions", _patch_conditions),
+}
+
+def _iterpatch(data: bytes, cfg: dict) -> ET.ElementTree:
+    """
+    Parse and patch a template in a single pass
+    
+    The first element to start with each target tag is the one patched,
+    matching _locate_targets, and it is patched from its end event once
+    its subtree is complete, so no separate lookup walk is needed
+    afterwards. The whole document is kept since it is written back out.
+    
+    Args:
+        data: Raw contents of the XML template
+        cfg: Configuration dictionary with patch values
+        
+    Returns:
+        Patched ET.ElementTree object
+    """
+    need = _needed_tags(cfg)
+    if not need:
+        # Nothing to patch, so there is nothing to watch for either
+        return _parse_xml_bytes(data)
+    
+    first_error = None
+    for encoding in (None, 'cp1252'):
+        chosen = {}
+        context = ET.iterparse(io.BytesIO(data), events=("start", "end"), tag=need,
+                               encoding=encoding, **_PARSER_OPTIONS)
+        try:
+            for event, el in context:
+                tag = el.tag
+                if event == "start":
+                    # Document order: keep the first target to open
+                    if tag not in chosen and _is_target(el):
+                        chosen[tag] = el
+                elif chosen.get(tag) is el:
+                    section, patch = _SECTION_PATCHERS[tag]
+                    patch(el, cfg[section])
+        except ET.XMLSyntaxError as e:
+            # Try with cp1252 encoding (Windows default) only when the
+            # bytes are not UTF-8; otherwise, or if that fails too,
+            # report the error from the first pass
+            if first_error is not None:
+                raise first_error from None
+            if _is_utf8(data):
+                raise
+            first_error = e
+            continue
+        return context.root.getroottree()
+
+def _split_lines(text):
+    """Split text into lines exactly like readlines() on a text file"""
+    return io.StringIO(text, newline=None).readlines()
+
+def _decode_lines(data: bytes):
+    """
+    Decode file contents into lines, falling back to cp1252 for Windows exports
+    
+    Args:
+        data: Raw file contents
+        
+    Returns:
+        List of lines with line endings kept
+    """
+    try:
+        text = data.decode('utf-8')
+    except UnicodeDecodeError:
+        text = data.decode('cp1252')
+    return _split_lines(text)
+
+def _serialize(tree: ET.ElementTree) -> bytes:
+    """
+    Serialize a tree to the bytes written to disk
+    
+    Args:
+        tree: ElementTree to serialize
+        
+    Returns:
+        UTF-8 encoded document including the XML declaration
+    """
+    # The whole document is built in one C-level pass; callers hand the
+    # result to a single write() rather than streaming element by element
+    return ET.tostring(tree, encoding="UTF-8", xml_declaration=True,
+                       method="xml", pretty_print=False)
+
+def _format_range(start, stop):
+    """Format a 0-based [start, stop) line range as a unified diff range"""
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return f"{beginning}"
+    if not length:
+        beginning -= 1
+    return f"{beginning},{length}"
+
+def generate_diff_from_lines(original_lines, new_lines, original_name, new_name):
+    """
+    Generate a unified diff between two lists of lines
+    
+    Output is identical to difflib.unified_diff, but lines are matched
+    as integer ids so SequenceMatcher never compares line strings.
+    
+    Args:
+        original_lines: Lines of the original file
+        new_lines: Lines of the new file
+        original_name: File name shown in the "---" header
+        new_name: File name shown in the "+++" header
+        
+    Returns:
+        String containing the unified diff
+    """
+    # Give every distinct line a small integer id
+    ids = {}
+    def line_id(line):
+        return ids.setdefault(line, len(ids))
+    a = list(map(line_id, original_lines))
+    b = list(map(line_id, new_lines))
+    
+    out = []
+    append = out.append
+    matcher = difflib.SequenceMatcher(None, a, b)
+    for group in matcher.get_grouped_opcodes(3):
+        if not out:
+            append(f"--- a/{original_name}\n")
+            append(f"+++ b/{new_name}\n")
+        first, last = group[0], group[-1]
+        append(f"@@ -{_format_range(first[1], last[2])} "
+               f"+{_format_range(first[3], last[4])} @@\n")
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                for line in original_lines[i1:i2]:
+                    append(' ' + line)
+                continue
+            if tag in ('replace', 'delete'):
+                for line in original_lines[i1:i2]:
+                    append('-' + line)
+            if tag in ('replace', 'insert'):
+                for line in new_lines[j1:j2]:
+                    append('+' + line)
+    
+    return ''.join(out)
 
 def generate_diff(original_path, new_path):
     """
@@ -136,25 +571,22 @@ def generate_diff(original_path, new_path):
     Returns:
         String containing the unified diff
     """
-    try:
-        with open(original_path, 'r', encoding='utf-8') as f:
-            original_lines = f.readlines()
-    except UnicodeDecodeError:
-        with open(original_path, 'r', encoding='cp1252') as f:
-            original_lines = f.readlines()
-    
-    with open(new_path, 'r', encoding='utf-8') as f:
-        new_lines = f.readlines()
-    
-    diff = difflib.unified_diff(
-        original_lines, 
-        new_lines,
-        fromfile=f'a/{original_path.name}',
-        tofile=f'b/{new_path.name}',
-        n=3
-    )
-    
-    return ''.join(diff)
+    original_path = pathlib.Path(original_path)
+    new_path = pathlib.Path(new_path)
+    return generate_diff_from_lines(_decode_lines(original_path.read_bytes()),
+                                    _decode_lines(new_path.read_bytes()),
+                                    original_path.name, new_path.name)
+
+_HEADER_COLORS = ('\033[1;36m', '\033[0m')   # File headers - cyan, bold
+_HUNK_COLORS = ('\033[1;34m', '\033[0m')     # Hunk ranges - blue, bold
+
+# First character of a diff line -> (longer prefix, its colors, colors otherwise)
+# as (ANSI start, ANSI reset) pairs used by format_diff_for_display
+_DIFF_COLORS = {
+    '+': ('+++', _HEADER_COLORS, ('\033[32m', '\033[0m')),  # Added lines - green
+    '-': ('---', _HEADER_COLORS, ('\033[31m', '\033[0m')),  # Removed lines - red
+    '@': ('@@', _HUNK_COLORS, None),
+}
 
 def format_diff_for_display(diff_content):
     """
@@ -166,31 +598,21 @@ def format_diff_for_display(diff_content):
     Returns:
         Formatted diff content for display
     """
-    # Split the diff into lines
-    lines = diff_content.splitlines()
     formatted_lines = []
-    
-    for line in lines:
-        if not line:
-            formatted_lines.append(line)
-            continue
-            
-        if line.startswith('+++') or line.startswith('---'):
-            # File headers - make them stand out
-            formatted_lines.append(f"\033[1;36m{line}\033[0m")  # Cyan, bold
-        elif line.startswith('@@'):
-            # Line information - make it distinct
-            formatted_lines.append(f"\033[1;34m{line}\033[0m")  # Blue, bold
-        elif line.startswith('+'):
-            # Added lines - green
-            # For XML, indent the tags for better readability
-            formatted_lines.append(f"\033[32m{line}\033[0m")    # Green
-        elif line.startswith('-'):
-            # Removed lines - red
-            formatted_lines.append(f"\033[31m{line}\033[0m")    # Red
-        else:
-            # Context lines - normal color
-            formatted_lines.append(line)
+    append = formatted_lines.append
+    
+    for line in diff_content.splitlines():
+        # One lookup on the first character; only those lines check the rest
+        entry = _DIFF_COLORS.get(line[:1])
+        if entry is not None:
+            prefix, prefix_colors, colors = entry
+            if line.startswith(prefix):
+                colors = prefix_colors
+            if colors is not None:
+                append(colors[0] + line + colors[1])
+                continue
+        # Context and empty lines - normal color
+        append(line)
             
     return '\n'.join(formatted_lines)
 
@@ -205,35 +627,43 @@ def validate_patch(tree: ET.ElementTree, cfg: dict):
     Returns:
         Tuple of (success, error_message)
     """
+    targets = _locate_targets(tree, _needed_tags(cfg))
+    
     # Validate BuildTradingOptions
-    if "trading_options" in cfg:
-        params = tree.find(".//BuildTradingOptions/Params")
+    if cfg.get("trading_options"):
+        params = targets.params
         if params is not None:
-            for k, expected in cfg["trading_options"].items():
-                elem = next((p for p in params if p.get("key")==k), None)
-                if elem is None or elem.text != str(expected):
+            existing = _index_params(params)
+            for k, value in cfg["trading_options"].items():
+                expected = _to_text(value)
+                elem = existing.get(k)
+                if elem is None or elem.text != expected:
                     actual = elem.text if elem is not None else "NOT FOUND"
                     return False, f"Validation failed for trading_options.{k}: expected '{expected}', got '{actual}'"
     
     # Validate BuildMode
-    if "build_mode" in cfg:
-        build_mode = tree.find(".//BuildMode")
+    if cfg.get("build_mode"):
+        build_mode = targets.build_mode
         if build_mode is not None:
-            for k, expected in cfg["build_mode"].items():
-                child = build_mode.find(f"./{k}")
-                if child is None or child.text != str(expected):
+            existing = _index_children(build_mode)
+            for k, value in cfg["build_mode"].items():
+                expected = _to_text(value)
+                child = _find_child(build_mode, existing, k)
+                if child is None or child.text != expected:
                     actual = child.text if child is not None else "NOT FOUND"
                     return False, f"Validation failed for build_mode.{k}: expected '{expected}', got '{actual}'"
     
     # Validate SL/PT
-    if "slpt" in cfg:
-        slpt = tree.find(".//SLPTOptions")
+    if cfg.get("slpt"):
+        slpt = targets.slpt
         if slpt is not None:
-            for k, expected in cfg["slpt"].items():
-                child = slpt.find(f"./{k}")
+            existing = _index_children(slpt)
+            for k, value in cfg["slpt"].items():
+                expected = _to_text(value)
+                child = _find_child(slpt, existing, k)
                 # Since we now create missing elements, this should always exist
                 # But we'll keep the check for robustness
-                if child is None or child.text != str(expected):
+                if child is None or child.text != expected:
                     actual = child.text if child is not None else "NOT FOUND"
                     return False, f"Validation failed for slpt.{k}: expected '{expected}', got '{actual}'"
     
@@ -252,25 +682,25 @@ def summarize_changes(cfg):
     summary = []
     
     # Trading options
-    if "trading_options" in cfg:
+    if cfg.get("trading_options"):
         summary.append("Trading Options:")
         for k, v in cfg["trading_options"].items():
             summary.append(f"  • {k} = {v}")
     
     # Build mode options
-    if "build_mode" in cfg:
+    if cfg.get("build_mode"):
         summary.append("\nBuild Mode:")
         for k, v in cfg["build_mode"].items():
             summary.append(f"  • {k} = {v}")
     
     # SL/PT options
-    if "slpt" in cfg:
+    if cfg.get("slpt"):
         summary.append("\nSL/PT Options:")
         for k, v in cfg["slpt"].items():
             summary.append(f"  • {k} = {v}")
     
     # Filter conditions
-    if "conditions" in cfg:
+    if cfg.get("conditions"):
         summary.append("\nFilter Conditions:")
         for condition_key, v in cfg["conditions"].items():
             summary.append(f"  • {condition_key} = {v}")
@@ -291,20 +721,38 @@ def main(args):
         return 1
     
     try:
-        cfg = yaml.safe_load(open(cfg_path))
+        cfg = _load_config(cfg_path, use_cache=not args.no_cache)
     except yaml.YAMLError as e:
         print(f"Error parsing YAML file: {e}", file=sys.stderr)
         return 1
     
-    # Parse XML
+    # An empty file loads as None and simply patches nothing
+    if cfg is None:
+        cfg = {}
+    elif not isinstance(cfg, dict):
+        print(f"Error parsing YAML file: expected a mapping of sections, got {type(cfg).__name__}", file=sys.stderr)
+        return 1
+    
+    # Strict validation is a mode of validation, so it implies --validate
+    validate = args.validate or args.strict_validate
+    
+    # Parse XML and apply patches; a plain write can patch while parsing
     try:
-        template = load_xml(template_path)
+        source = template_path.read_bytes()
+        if not validate and not args.dry_run:
+            template = _iterpatch(source, cfg)
+        else:
+            template = _parse_xml_bytes(source)
+            checks = apply_patch(template, cfg)
     except ET.ParseError as e:
         print(f"Error parsing XML template: {e}", file=sys.stderr)
         return 1
+    except ValueError as e:
+        print(f"Error applying patch: {e}", file=sys.stderr)
+        return 1
     
-    # Apply patches
-    apply_patch(template, cfg)
+    # Lines of the original template, shared by both diff paths
+    original_lines = _decode_lines(source)
     
     # Determine output path
     if args.out:
@@ -313,33 +761,29 @@ def main(args):
         timestamp = datetime.datetime.now().strftime("%Y-%m-%dT%H-%M")
         out_path = pathlib.Path(f"out/Mean-Reversal_{timestamp}.xml")
     
-    # For dry-run mode, create a temporary file for diff
+    # For dry-run mode, diff against the serialized tree in memory
     if args.dry_run:
-        temp_dir = pathlib.Path(tempfile.gettempdir())
-        temp_out = temp_dir / "temp_patched.xml"
-        template.write(temp_out, encoding="utf-8", xml_declaration=True)
-        
-        # Generate diff
-        diff_content = generate_diff(template_path, temp_out)
+        diff_content = generate_diff_from_lines(
+            original_lines,
+            _decode_lines(_serialize(template)),
+            template_path.name,
+            out_path.name
+        )
         
         # Print summary of changes
         print("\n=== 📋 Summary of Changes ===\n")
         print(summarize_changes(cfg))
         
-        # Print the diff with formatting
+        # Print the diff, colored only when a terminal will render it
         print("\n=== 📄 Diff Preview (Dry Run) ===\n")
-        try:
+        if sys.stdout.isatty():
             print(format_diff_for_display(diff_content))
-        except Exception:
-            # Fallback to plain diff if formatting fails
-            print(diff_content)
-        
-        # Remove temp file
-        temp_out.unlink()
+        else:
+            sys.stdout.write(diff_content)
         
-        if args.validate:
-            # Validate using the XML tree in memory
-            success, message = validate_patch(template, cfg)
+        if validate:
+            # Validate the elements written by apply_patch
+            success, message = verify_checks(checks)
             if success:
                 print(f"\n✅ {message}")
             else:
@@ -352,12 +796,18 @@ def main(args):
     out_path.parent.mkdir(parents=True, exist_ok=True)
     
     # Write patched file
-    template.write(out_path, encoding="utf-8", xml_declaration=True)
+    patched_bytes = _serialize(template)
+    out_path.write_bytes(patched_bytes)
     print(f"✅ Patched file written to {out_path}")
     
-    # Generate diff file
+    # Generate diff file from the bytes just written
     diff_path = out_path.with_suffix(".diff")
-    diff_content = generate_diff(template_path, out_path)
+    diff_content = generate_diff_from_lines(
+        original_lines,
+        _decode_lines(patched_bytes),
+        template_path.name,
+        out_path.name
+    )
     
     with open(diff_path, 'w', encoding='utf-8') as f:
         f.write(diff_content)
@@ -365,18 +815,22 @@ def main(args):
     print(f"✅ Diff file written to {diff_path}")
     
     # Validate if requested
-    if args.validate:
-        # Re-parse the output file to ensure it's valid
-        try:
-            patched = load_xml(out_path)
-            success, message = validate_patch(patched, cfg)
-            if success:
-                print(f"✅ {message}")
-            else:
-                print(f"❌ {message}", file=sys.stderr)
+    if validate:
+        if args.strict_validate:
+            # Re-parse the output file to ensure it round-trips
+            try:
+                patched = load_xml(out_path)
+            except ET.ParseError as e:
+                print(f"Error validating patched XML: {e}", file=sys.stderr)
                 return 1
-        except ET.ParseError as e:
-            print(f"Error validating patched XML: {e}", file=sys.stderr)
+            success, message = validate_patch(patched, cfg)
+        else:
+            # The written bytes were serialized from these elements
+            success, message = verify_checks(checks)
+        if success:
+            print(f"✅ {message}")
+        else:
+            print(f"❌ {message}", file=sys.stderr)
             return 1
     
     return 0
@@ -387,6 +841,8 @@ if __name__ == "__main__":
     ap.add_argument("--cfg", required=True, help="Path to the YAML configuration file")
     ap.add_argument("--out", help="Output path for the patched XML file")
     ap.add_argument("--validate", action="store_true", help="Validate the output file after patching")
+    ap.add_argument("--strict-validate", action="store_true", help="Validate by re-parsing the written file instead of checking the patched tree in memory (implies --validate; dry runs always check in memory)")
     ap.add_argument("--dry-run", action="store_true", help="Print diff without writing files")
+    ap.add_argument("--no-cache", action="store_true", help="Always re-parse the YAML config instead of reusing a cached parse")
     
     sys.exit(main(ap.parse_args()))
\ No newline at end of file
@@ -13,6 +13,7 @@ setup(
     },
     install_requires=[
         "pyyaml>=6.0",
+        "lxml>=5.0",
     ],
     python_requires=">=3.6",
     entry_points={
@@ -1,14 +1,18 @@
 #!/usr/bin/env python3
 # tests/test_roundtrip.py
+import argparse
+import contextlib
+import io
 import pathlib
 import tempfile
-import xml.etree.ElementTree as ET
+from lxml import etree as ET
 import yaml
 
 import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from patcher import load_xml, apply_patch, validate_patch
+from patcher import load_xml, apply_patch, validate_patch, verify_checks, generate_diff, generate_diff_from_lines, main
+from patcher import _iterpatch, _parse_xml_bytes, _serialize, _load_config, _load_yaml_cached
 
 def test_key_application():
     """Test that all keys in YAML are applied to the XML"""
@@ -130,6 +134,431 @@ def test_key_application():
         # Clean up the template file
         template_path.unlink(missing_ok=True)
 
+def test_condition_application():
+    """Test that filter conditions are matched by column and sample type"""
+    template_str = """<?xml version="1.0" encoding="utf-8"?>
+    <Strategy>
+        <FilterParams>
+            <Conditions>
+                <Condition use="false">
+                    <Left-Side><Column-Value column="ProfitFactor" sampleType="10"/></Left-Side>
+                    <Right-Side><Numeric-Value value="1.0"/></Right-Side>
+                </Condition>
+                <Condition use="false">
+                    <Left-Side><Column-Value column="ProfitFactor" sampleType="20"/></Left-Side>
+                    <Right-Side><Numeric-Value value="1.0"/></Right-Side>
+                </Condition>
+                <Condition use="false">
+                    <Left-Side><Column-Value column="Net_Profit" sampleType="10"/></Left-Side>
+                    <Right-Side><Numeric-Value value="0"/></Right-Side>
+                </Condition>
+            </Conditions>
+        </FilterParams>
+    </Strategy>
+    """
+    
+    config = {
+        "conditions": {
+            "ProfitFactor_OOS": 1.1,
+            "Net_Profit_IS": 5,
+            "ProfitFactor_XX": 9,
+            "NoSampleType": 9
+        }
+    }
+    
+    with tempfile.NamedTemporaryFile(suffix=".xml", delete=False) as f:
+        f.write(template_str.encode('utf-8'))
+        template_path = pathlib.Path(f.name)
+    
+    try:
+        tree = load_xml(template_path)
+        apply_patch(tree, config)
+        
+        conditions = tree.getroot().findall(".//FilterParams/Conditions/Condition")
+        values = [c.find("./Right-Side/Numeric-Value").get("value") for c in conditions]
+        uses = [c.get("use") for c in conditions]
+        
+        assert values == ["1.0", "1.1", "5"]
+        assert uses == ["false", "true", "true"]
+    finally:
+        template_path.unlink(missing_ok=True)
+
+def test_cp1252_template():
+    """Test that Windows-1252 exports mislabelled as UTF-8 still load"""
+    template_str = """<?xml version="1.0" encoding="utf-8"?>
+    <Strategy>
+        <BuildMode>
+            <Description>Stratégie</Description>
+        </BuildMode>
+    </Strategy>
+    """
+    
+    with tempfile.NamedTemporaryFile(suffix=".xml", delete=False) as f:
+        f.write(template_str.encode('cp1252'))
+        template_path = pathlib.Path(f.name)
+    
+    try:
+        tree = load_xml(template_path)
+        assert tree.getroot().find(".//Description").text == "Stratégie"
+    finally:
+        template_path.unlink(missing_ok=True)
+
+def test_diff_matches_difflib():
+    """Test that the id-based diff produces exactly difflib's unified diff"""
+    import difflib
+    
+    original = ["<a>\n", "  <b>1</b>\n", "  <b>1</b>\n", "  <c/>\n", "</a>\n"] * 4
+    new = list(original)
+    new[1] = "  <b>2</b>\n"
+    new.insert(10, "  <d/>\n")
+    del new[15]
+    
+    expected = ''.join(difflib.unified_diff(
+        original, new, fromfile='a/old.xml', tofile='b/new.xml', n=3))
+    
+    assert generate_diff_from_lines(original, new, 'old.xml', 'new.xml') == expected
+    assert generate_diff_from_lines(original, original, 'old.xml', 'new.xml') == ''
+    
+    # The file-based wrapper diffs the same lines read from disk
+    with tempfile.TemporaryDirectory() as tmp:
+        old_path = pathlib.Path(tmp) / "old.xml"
+        new_path = pathlib.Path(tmp) / "new.xml"
+        old_path.write_text(''.join(original), encoding='utf-8')
+        new_path.write_text(''.join(new), encoding='utf-8')
+        assert generate_diff(old_path, new_path) == expected
+
+def test_verify_checks():
+    """Test that apply_patch returns checks that detect later changes"""
+    template_str = """<?xml version="1.0" encoding="utf-8"?>
+    <Strategy>
+        <BuildMode>
+            <Islands>2</Islands>
+        </BuildMode>
+    </Strategy>
+    """
+    
+    with tempfile.NamedTemporaryFile(suffix=".xml", delete=False) as f:
+        f.write(template_str.encode('utf-8'))
+        template_path = pathlib.Path(f.name)
+    
+    try:
+        tree = load_xml(template_path)
+        checks = apply_patch(tree, {"build_mode": {"Islands": 4, "PopulationSize": 200}})
+        
+        assert [label for label, _, _ in checks] == ["build_mode.Islands", "build_mode.PopulationSize"]
+        assert verify_checks(checks) == (True, "Validation successful")
+        
+        tree.getroot().find(".//Islands").text = "3"
+        success, message = verify_checks(checks)
+        assert not success
+        assert message == "Validation failed for build_mode.Islands: expected '4', got '3'"
+    finally:
+        template_path.unlink(missing_ok=True)
+
+def test_boolean_values():
+    """Test that YAML booleans are written the way SQX spells them"""
+    template_str = """<?xml version="1.0" encoding="utf-8"?>
+    <Strategy>
+        <BuildTradingOptions>
+            <Params>
+                <Param key="DontTradeOnWeekends" class="Generic">false</Param>
+            </Params>
+        </BuildTradingOptions>
+        <SLPTOptions>
+            <SLRequired>true</SLRequired>
+        </SLPTOptions>
+    </Strategy>
+    """
+    
+    config = {
+        "trading_options": {"DontTradeOnWeekends": True},
+        "slpt": {"SLRequired": False, "MinSLATRMultiple": 0.5}
+    }
+    
+    with tempfile.NamedTemporaryFile(suffix=".xml", delete=False) as f:
+        f.write(template_str.encode('utf-8'))
+        template_path = pathlib.Path(f.name)
+    
+    try:
+        tree = load_xml(template_path)
+        apply_patch(tree, config)
+        
+        success, message = validate_patch(tree, config)
+        assert success, f"Validation failed: {message}"
+        
+        root = tree.getroot()
+        assert root.find(".//Param[@key='DontTradeOnWeekends']").text == "true"
+        assert root.find(".//SLPTOptions/SLRequired").text == "false"
+        assert root.find(".//SLPTOptions/MinSLATRMultiple").text == "0.5"
+    finally:
+        template_path.unlink(missing_ok=True)
+
+def test_empty_sections():
+    """Test that empty or null config sections are skipped"""
+    template_str = """<?xml version="1.0" encoding="utf-8"?>
+    <Strategy>
+        <BuildMode>
+            <Islands>2</Islands>
+        </BuildMode>
+    </Strategy>
+    """
+    
+    config = yaml.safe_load("build_mode:\n  Islands: 4\nslpt: {}\nconditions:\n")
+    
+    with tempfile.NamedTemporaryFile(suffix=".xml", delete=False) as f:
+        f.write(template_str.encode('utf-8'))
+        template_path = pathlib.Path(f.name)
+    
+    try:
+        tree = load_xml(template_path)
+        checks = apply_patch(tree, config)
+        
+        assert [label for label, _, _ in checks] == ["build_mode.Islands"]
+        assert validate_patch(tree, config) == (True, "Validation successful")
+        assert apply_patch(tree, {}) == []
+        
+        # An empty config patches nothing; a non-mapping one is an error
+        with tempfile.TemporaryDirectory() as out_dir:
+            for body, expected_rc in ((b"", 0), (b"# comments only\n", 0), (b"- build_mode\n", 1)):
+                cfg_path = pathlib.Path(out_dir) / "cfg.yaml"
+                cfg_path.write_bytes(body)
+                for dry_run, validate in ((True, True), (False, False), (False, True)):
+                    args = argparse.Namespace(
+                        template=str(template_path), cfg=str(cfg_path),
+                        out=str(pathlib.Path(out_dir) / "out.xml"), validate=validate,
+                        strict_validate=False, dry_run=dry_run, no_cache=True)
+                    assert main(args) == expected_rc
+    finally:
+        template_path.unlink(missing_ok=True)
+
+def test_iterpatch_matches_apply_patch():
+    """Test that the single-pass write path patches the same elements"""
+    template = b"""<?xml version="1.0" encoding="utf-8"?>
+    <Strategy>
+        <!-- nested sections: the outer one comes first in document order -->
+        <BuildMode>
+            <Islands>2</Islands>
+            <Sub><BuildMode><Islands>1</Islands></BuildMode></Sub>
+        </BuildMode>
+        <BuildTradingOptions>
+            <Params><Param key="MaxTradesPerDay" class="Generic">0</Param></Params>
+        </BuildTradingOptions>
+        <Other><Conditions/></Other>
+        <FilterParams>
+            <Conditions>
+                <Condition use="false">
+                    <Left-Side><Column-Value column="NetProfit" sampleType="10"/></Left-Side>
+                    <Right-Side><Numeric-Value value="0"/></Right-Side>
+                </Condition>
+            </Conditions>
+        </FilterParams>
+    </Strategy>
+    """
+    
+    config = {
+        "trading_options": {"MaxTradesPerDay": 6, "ExitOnFriday": True},
+        "build_mode": {"Islands": 4, "PopulationSize": 200},
+        "slpt": {"MinSLInPips": 5},
+        "conditions": {"NetProfit_IS": 10}
+    }
+    
+    tree = _parse_xml_bytes(template)
+    apply_patch(tree, config)
+    
+    streamed = _iterpatch(template, config)
+    assert _serialize(streamed) == _serialize(tree)
+    
+    islands = streamed.getroot().findall(".//Islands")
+    assert [e.text for e in islands] == ["4", "1"]
+
+def test_external_entities_not_resolved():
+    """Test that external entities in a template are never expanded"""
+    with tempfile.NamedTemporaryFile(suffix=".txt", delete=False) as f:
+        f.write(b"SECRET")
+        secret_path = pathlib.Path(f.name)
+    
+    template = f"""<?xml version="1.0" encoding="utf-8"?>
+    <!DOCTYPE Strategy [<!ENTITY leak SYSTEM "{secret_path.as_uri()}">]>
+    <Strategy>
+        <Note>&leak;</Note>
+        <BuildMode><Islands>2</Islands></BuildMode>
+    </Strategy>
+    """.encode('utf-8')
+    
+    try:
+        config = {"build_mode": {"Islands": 4}}
+        
+        tree = _parse_xml_bytes(template)
+        apply_patch(tree, config)
+        
+        for patched in (tree, _iterpatch(template, config)):
+            assert b"SECRET" not in _serialize(patched)
+    finally:
+        secret_path.unlink(missing_ok=True)
+
+def test_nested_and_invalid_keys():
+    """Test slash-separated keys and keys that are not valid element names"""
+    template_str = """<?xml version="1.0" encoding="utf-8"?>
+    <Strategy>
+        <BuildMode>
+            <Child><Sub>1</Sub></Child>
+        </BuildMode>
+    </Strategy>
+    """
+    
+    with tempfile.NamedTemporaryFile(suffix=".xml", delete=False) as f:
+        f.write(template_str.encode('utf-8'))
+        template_path = pathlib.Path(f.name)
+    
+    with tempfile.NamedTemporaryFile(suffix=".yaml", delete=False) as f:
+        cfg_path = pathlib.Path(f.name)
+    
+    try:
+        # A slash-separated key updates the existing nested element
+        config = {"build_mode": {"Child/Sub": 2}}
+        tree = load_xml(template_path)
+        apply_patch(tree, config)
+        assert tree.getroot().find(".//Child/Sub").text == "2"
+        assert validate_patch(tree, config) == (True, "Validation successful")
+        
+        # A key that cannot become an element is a clean error
+        for key in ("Missing/Sub", "Bad Tag", 2020):
+            tree = load_xml(template_path)
+            try:
+                apply_patch(tree, {"build_mode": {key: 1}})
+            except ValueError as e:
+                assert f"<{key}>" in str(e)
+            else:
+                assert False, f"{key!r} should be rejected"
+        
+        # ... and main reports it instead of raising
+        for body in (b"build_mode:\n  Bad Tag: 1\n", b"build_mode:\n  2020: x\n"):
+            cfg_path.write_bytes(body)
+            for validate in (False, True):
+                args = argparse.Namespace(
+                    template=str(template_path), cfg=str(cfg_path), out=None,
+                    validate=validate, strict_validate=False, dry_run=True, no_cache=True)
+                assert main(args) == 1
+                args.dry_run = False
+                assert main(args) == 1
+    finally:
+        template_path.unlink(missing_ok=True)
+        cfg_path.unlink(missing_ok=True)
+
+def test_malformed_utf8_template():
+    """Test that a malformed UTF-8 template is an error, not re-decoded"""
+    template = """<?xml version="1.0" encoding="utf-8"?>
+    <Strategy>
+        <BuildMode>
+            <Name>Stratégie</Name>
+            <Bad>\uFFFE</Bad>
+        </BuildMode>
+    </Strategy>
+    """.encode('utf-8')
+    
+    config = {"build_mode": {"Name": "x"}}
+    for parse in (_parse_xml_bytes, lambda data: _iterpatch(data, config)):
+        try:
+            parse(template)
+        except ET.ParseError:
+            pass
+        else:
+            assert False, "malformed UTF-8 template should not parse"
+
+def test_config_cache():
+    """Test that cached config loads see edits and hand out private copies"""
+    template_str = """<?xml version="1.0" encoding="utf-8"?>
+    <Strategy>
+        <BuildMode>
+            <Islands>2</Islands>
+        </BuildMode>
+    </Strategy>
+    """
+    
+    with tempfile.NamedTemporaryFile(suffix=".xml", delete=False) as f:
+        f.write(template_str.encode('utf-8'))
+        template_path = pathlib.Path(f.name)
+    
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            cfg_path = pathlib.Path(tmp) / "cfg.yaml"
+            out_path = pathlib.Path(tmp) / "out.xml"
+            args = argparse.Namespace(
+                template=str(template_path), cfg=str(cfg_path), out=str(out_path),
+                validate=True, strict_validate=False, dry_run=False, no_cache=False)
+            
+            # An edit between runs changes the size, so the second run re-parses
+            for islands in ("4", "16"):
+                cfg_path.write_text(f"build_mode:\n  Islands: {islands}\n", encoding='utf-8')
+                assert main(args) == 0
+                assert load_xml(out_path).find("BuildMode/Islands").text == islands
+            
+            # Mutating a loaded config leaves the cached parse intact
+            cfg = _load_config(cfg_path)
+            cfg["build_mode"]["Islands"] = 99
+            assert _load_config(cfg_path) == {"build_mode": {"Islands": 16}}
+            
+            # The cache is keyed on the resolved path, not the path as typed
+            hits = _load_yaml_cached.cache_info().hits
+            _load_config(pathlib.Path(tmp) / "." / "cfg.yaml")
+            assert _load_yaml_cached.cache_info().hits == hits + 1
+            
+            # --no-cache never touches the cache
+            info = _load_yaml_cached.cache_info()
+            args.no_cache = True
+            assert main(args) == 0
+            assert _load_config(cfg_path, use_cache=False) == {"build_mode": {"Islands": 16}}
+            assert _load_yaml_cached.cache_info() == info
+    finally:
+        template_path.unlink(missing_ok=True)
+
+def test_strict_validate():
+    """Test that --strict-validate re-parses the written file and implies --validate"""
+    template_str = """<?xml version="1.0" encoding="utf-8"?>
+    <Strategy>
+        <BuildMode>
+            <Islands>2</Islands>
+        </BuildMode>
+    </Strategy>
+    """
+    
+    with tempfile.NamedTemporaryFile(suffix=".xml", delete=False) as f:
+        f.write(template_str.encode('utf-8'))
+        template_path = pathlib.Path(f.name)
+    
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            cfg_path = pathlib.Path(tmp) / "cfg.yaml"
+            cfg_path.write_text("build_mode:\n  Islands: 4\n  PopulationSize: 200\n", encoding='utf-8')
+            out_path = pathlib.Path(tmp) / "out.xml"
+            
+            for dry_run in (False, True):
+                args = argparse.Namespace(
+                    template=str(template_path), cfg=str(cfg_path), out=str(out_path),
+                    validate=False, strict_validate=True, dry_run=dry_run, no_cache=True)
+                stdout = io.StringIO()
+                with contextlib.redirect_stdout(stdout):
+                    assert main(args) == 0
+                assert "Validation successful" in stdout.getvalue()
+            
+            patched = load_xml(out_path)
+            assert patched.find("BuildMode/Islands").text == "4"
+            assert patched.find("BuildMode/PopulationSize").text == "200"
+    finally:
+        template_path.unlink(missing_ok=True)
+
 if __name__ == "__main__":
     test_key_application()
+    test_condition_application()
+    test_cp1252_template()
+    test_diff_matches_difflib()
+    test_verify_checks()
+    test_boolean_values()
+    test_empty_sections()
+    test_iterpatch_matches_apply_patch()
+    test_external_entities_not_resolved()
+    test_nested_and_invalid_keys()
+    test_malformed_utf8_template()
+    test_config_cache()
+    test_strict_validate()
     print("All tests passed!")
\ No newline at end of file